@@ -2,19 +2,26 @@
 
 """
 Conversion of Czesl XML to Manatee
+
+Element names are matched with the '{*}' wildcard, i.e. in any namespace or none,
+since Czesl XML files may declare a default namespace.
 """
 
 import argparse
+import contextlib
+import io
+import itertools
+import os
 import sys
-import bs4
 import traceback
 
 from czeslconv import iotools
 from czeslconv.iotools import MetaFile, MetaXml
 
-from bs4 import BeautifulSoup
-from collections import defaultdict, deque
-from typing import Any, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Union, Tuple
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from lxml import etree
+from typing import Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, TextIO, Union, Tuple
 
 # Separator used when fitting multiple POS-tags within a single vertical field
 POS_TAG_SEP = '|'
@@ -22,15 +29,43 @@ POS_TAG_SEP = '|'
 DEL_TOK_STR = '===NONE==='
 DEL_TOK_ID = 'NA'
 
+# Pool of lemma and tag strings shared by all tokens; the tag inventory is small
+# and lemmas repeat throughout a corpus
+_strPool: Dict[Optional[str], Optional[str]] = {}
+
+
+def _pooled(s: Optional[str]) -> Optional[str]:
+    return _strPool.setdefault(s, s)
+
+
+# Morphs are never modified and a corpus uses a limited set of lemma and tag combinations,
+# tokens with the same analysis share one Morph, keyed by (lemma, *tags)
+_morphPool: Dict[Tuple[Optional[str], ...], 'Morph'] = {}
+
 
 class Morph(NamedTuple):
     lemma: str
     tags: Sequence[str]
 
     @staticmethod
-    def fromLexTag(lex: bs4.Tag) -> 'Morph':
-        assert len(lex.find_all(name='lemma', recursive=False)) == 1
-        return Morph(lemma=lex.lemma.string, tags=[t.string for t in lex.find_all(name='mtag', recursive=False)])
+    def fromLexTag(lex: etree._Element) -> 'Morph':
+        # a single walk over the children, classified by their local name
+        lemmas = []
+        tags = []
+        for child in lex.iterchildren(etree.Element):
+            name = child.tag.rpartition('}')[2]
+            if name == 'lemma':
+                lemmas.append(child.text)
+            elif name == 'mtag':
+                tags.append(child.text)
+
+        assert len(lemmas) == 1
+        morph = _morphPool.get((lemmas[0], *tags))
+        if morph is None:
+            morph = Morph(lemma=_pooled(lemmas[0]), tags=tuple(_pooled(t) for t in tags))
+            # the stored key is built from the pooled strings, so that each string is kept only once
+            _morphPool[(morph.lemma, *morph.tags)] = morph
+        return morph
 
 class WToken(NamedTuple):
     text: str
@@ -51,22 +86,95 @@ class ErrorData(NamedTuple):
     links: Sequence[str]
 
     @staticmethod
-    def fromTag(error: bs4.Tag) -> 'ErrorData':
-        tags = [t.string for t in error.find_all(name='tag')]
-        links = [l.string for l in error.find_all(name='link')]
+    def fromTag(error: etree._Element) -> 'ErrorData':
+        tags = [_pooled(t.text) for t in error.iter('{*}tag')]
+        links = [l.text for l in error.iter('{*}link')]
         return ErrorData(tags=tags, links=links)
 
 
+def _tagStr(elem: etree._Element) -> str:
+    """
+    XML serialization of an element, used in diagnostic messages
+    """
+    return etree.tostring(elem, encoding='unicode', with_tail=False)
+
+
+def _afterHash(ref: str) -> str:
+    """
+    ID part of a reference of the form '<layer>#<id>'
+    """
+    _, sep, refId = ref.partition('#')
+    if not sep:
+        raise ValueError(f'reference without "#": {ref}')
+    return refId
+
+
+def _firstChild(elem: etree._Element, name: str) -> Optional[etree._Element]:
+    """
+    First child element with the given name. Unlike find(), iterchildren() does not go through
+    the Python-level ElementPath machinery.
+    """
+    return next(elem.iterchildren(name), None)
+
+
+def _firstElem(root: etree._Element, name: str) -> Optional[etree._Element]:
+    """
+    First element with the given name in document order, including the root itself
+    """
+    return next(root.iter(name), None)
+
+
 class DeletionToken(NamedTuple):
     fromId: str
     errors: Sequence[ErrorData]
 
 
+class Edge(NamedTuple):
+    """
+    Content of an <edge> element: IDs of the linked lower-layer tokens (from), IDs of further
+    linked tokens of the edge's own layer (to) and the <error> elements
+    """
+    fromIds: Sequence[str]
+    toIds: Sequence[str]
+    errors: Sequence[etree._Element]
+
+    @staticmethod
+    def fromTag(edge: etree._Element) -> 'Edge':
+        # a single walk over the children, classified by their local name
+        fromIds = []
+        toIds = []
+        errors = []
+        for child in edge.iterchildren(etree.Element):
+            name = child.tag.rpartition('}')[2]
+            if name == 'from':
+                fromIds.append(_afterHash(child.text))
+            elif name == 'to':
+                toIds.append(child.text)
+            elif name == 'error':
+                errors.append(child)
+
+        return Edge(fromIds=fromIds, toIds=toIds, errors=errors)
+
+
+class WElem(NamedTuple):
+    """
+    <w> element together with data already extracted from it when building the ID maps
+    """
+    tag: etree._Element
+    tid: str
+    edges: Sequence[Edge]
+    sentenceId: Optional[str] = None
+
+
 class AnnotToken:
     """
     Annotated token with link to other layers
     """
 
+    __slots__ = (
+        'tid', 'baseToken', 'layer', 'sentenceId', 'linkIdsLower', 'linkIdsHigher', 'errors', 'linksLower', 'linksHigher'
+    )
+
     def __init__(self,
             tid:str,
             baseToken: Union[WToken, AToken, BToken],
@@ -83,9 +191,10 @@ class AnnotToken:
         self.baseToken = baseToken
         self.layer = layer
         self.sentenceId = sentenceId
-        self.linkIdsLower: List[str] = list(linkIdsLower) if linkIdsLower else []
-        self.linkIdsHigher: List[str] = list(linkIdsHigher) if linkIdsHigher else []
-        self.errors: List[ErrorData] = list(errors) if errors else []
+        # ID links and errors are not modified after construction, tuples are smaller and the empty one is shared
+        self.linkIdsLower: Sequence[str] = tuple(linkIdsLower) if linkIdsLower else ()
+        self.linkIdsHigher: Sequence[str] = tuple(linkIdsHigher) if linkIdsHigher else ()
+        self.errors: Sequence[ErrorData] = tuple(errors) if errors else ()
         self.linksLower: List[Union[AnnotToken, DeletionToken]] = list(linksLower) if linksLower else []
         self.linksHigher: List[Union[AnnotToken, DeletionToken]] = list(linksHigher) if linksHigher else []
 
@@ -100,15 +209,6 @@ class TokenLayer(NamedTuple):
     tokens: Sequence[AnnotToken]
     idToToken: Mapping[str, AnnotToken]
 
-    @staticmethod
-    def of(name:str, tokens: Sequence[AnnotToken]) -> 'TokenLayer':
-        tokens = list(tokens)
-        idToToken = {t.tid: t for t in tokens}
-        return TokenLayer(name, tokens, idToToken)
-
-    def get(self, tid:str) -> Optional[AnnotToken]:
-        return self.idToToken.get(tid)
-
     def __iter__(self) -> Iterator[AnnotToken]:
         return iter(self.tokens)
 
@@ -116,140 +216,145 @@ class TokenLayer(NamedTuple):
         return len(self.tokens)
 
 
-def revertMapping(mapping: Mapping[Any, Iterable[Any]]) -> Mapping[Any, List[Any]]:
-    revertedMap: Mapping[Any, List[Any]] = defaultdict(list)
-    for k, vals in mapping.items():
-        for v in vals:
-            revertedMap[v].append(k)
+def _tokenAndLexes(wTag: etree._Element) -> Tuple[Optional[etree._Element], List[etree._Element]]:
+    """
+    The first <token> child and all <lex> children of an a or b <w> element, found in a single walk
+    """
+    tokenTag = None
+    lexes = []
+    for child in wTag.iterchildren(etree.Element):
+        name = child.tag.rpartition('}')[2]
+        if name == 'lex':
+            lexes.append(child)
+        elif name == 'token' and tokenTag is None:
+            tokenTag = child
 
-    return revertedMap
+    return tokenTag, lexes
 
 
 def createWLayer(
-        wPara: bs4.Tag,
+        wPara: etree._Element,
         idMapWA: Mapping[str, List[str]],
         idToDelW: Mapping[str, DeletionToken]
 ) -> TokenLayer:
 
     tokens: List[AnnotToken] = []
+    idToToken: Dict[str, AnnotToken] = {}
 
-    for wTag in wPara.find_all(name='w'):
-        wid = wTag['id']
+    for wTag in wPara.iter('{*}w'):
+        wid = wTag.get('id')
 
         delNode = idToDelW.get(wid)
         linkIdsHigher = idMapWA[wid]
 
         if not delNode and not linkIdsHigher:
-            print(f'W-layer token with no links to A-layer: {wTag}', file=sys.stderr)
+            print(f'W-layer token with no links to A-layer: {_tagStr(wTag)}', file=sys.stderr)
         elif delNode and linkIdsHigher:
-            print(f'W-layer token with both deletion and non-deletion edges to A-layer: {wTag}', file=sys.stderr)
+            print(f'W-layer token with both deletion and non-deletion edges to A-layer: {_tagStr(wTag)}', file=sys.stderr)
 
-        tokens.append(AnnotToken(
+        token = AnnotToken(
             tid=wid,
-            baseToken=WToken(wTag.token.string),
+            baseToken=WToken(_firstChild(wTag, '{*}token').text),
             layer='w',
             linkIdsHigher=linkIdsHigher,
             linksHigher=[delNode] if delNode else []
-        ))
+        )
+        tokens.append(token)
+        idToToken[wid] = token
 
-    return TokenLayer.of('w', tokens)
+    return TokenLayer('w', tokens, idToToken)
 
 
 def createALayer(
-        aPara: bs4.Tag,
+        aElems: Iterable[WElem],
         idMapAW: Mapping[str, List[str]],
         idMapAB: Mapping[str, List[str]],
         idToDelA: Mapping[str, DeletionToken]
 ) -> TokenLayer:
 
     tokens: List[AnnotToken] = []
+    idToToken: Dict[str, AnnotToken] = {}
 
-    for wTag in aPara.find_all(name='w'):
-        wid = wTag['id']
-
-        if not wTag.lex:
-            print(f'skipping token with no lex tag: {wTag}', file=sys.stderr)
+    for wTag, wid, edges, _ in aElems:
+        tokenTag, lexes = _tokenAndLexes(wTag)
+        if not lexes:
+            print(f'skipping token with no lex tag: {_tagStr(wTag)}', file=sys.stderr)
             continue
 
-        morphs = [Morph.fromLexTag(lex) for lex in wTag.find_all(name='lex', recursive=False)]
+        morphs = [Morph.fromLexTag(lex) for lex in lexes]
 
-        if len(wTag.find_all(name='edge', recursive=False)) > 1:
-            print(f'w-tag contains multiple edges: {wTag}', file=sys.stderr)
-            errors = [ErrorData.fromTag(err) for edge in wTag.find_all(name='edge', recursive=False)
-                    for err in edge.find_all(name='error')]
-        else:
-            errors = [ErrorData.fromTag(err) for err in wTag.edge.find_all(name='error')] if wTag.edge else []
+        if len(edges) > 1:
+            print(f'w-tag contains multiple edges: {_tagStr(wTag)}', file=sys.stderr)
+        errors = [ErrorData.fromTag(err) for edge in edges for err in edge.errors]
 
         delNode = idToDelA.get(wid)
         linkIdsHigher = idMapAB[wid]
 
         if not delNode and not linkIdsHigher:
-            print(f'A-layer token with no links to B-layer: {wTag}', file=sys.stderr)
+            print(f'A-layer token with no links to B-layer: {_tagStr(wTag)}', file=sys.stderr)
         elif delNode and linkIdsHigher:
-            print(f'A-layer token with both deletion and non-deletion edges to B-layer: {wTag}', file=sys.stderr)
+            print(f'A-layer token with both deletion and non-deletion edges to B-layer: {_tagStr(wTag)}', file=sys.stderr)
 
-        tokens.append(AnnotToken(
+        token = AnnotToken(
             tid=wid,
-            baseToken=AToken(text=wTag.token.string, morphs=morphs),
+            baseToken=AToken(text=tokenTag.text, morphs=morphs),
             layer='a',
             linkIdsLower=idMapAW[wid],
             linkIdsHigher=linkIdsHigher,
             linksHigher=[delNode] if delNode else [],
             errors=errors
-        ))
+        )
+        tokens.append(token)
+        idToToken[wid] = token
 
-    return TokenLayer.of('a', tokens)
+    return TokenLayer('a', tokens, idToToken)
 
 
 def createBLayer(
-        bPara: bs4.Tag,
+        bElems: Iterable[WElem],
         idMapBA: Mapping[str, List[str]],
 ) -> TokenLayer:
 
     tokens: List[AnnotToken] = []
+    idToToken: Dict[str, AnnotToken] = {}
 
-    for sentTag in bPara.find_all(name='s', recursive=False):
-        sentId = sentTag['id']
-        for wTag in sentTag.find_all(name='w', recursive=False):
-            wid = wTag['id']
-
-            if not wTag.lex:
-                print(f'skipping token with no lex tag: {wTag}', file=sys.stderr)
-                continue
+    for wTag, wid, edges, sentId in bElems:
+        tokenTag, lexes = _tokenAndLexes(wTag)
+        if not lexes:
+            print(f'skipping token with no lex tag: {_tagStr(wTag)}', file=sys.stderr)
+            continue
 
-            assert len(wTag.find_all(name='lex', recursive=False)) == 1, f'B-layer w-tag contains multiple lex tags: {wTag}'
-            morph = Morph.fromLexTag(wTag.lex)
+        assert len(lexes) == 1, f'B-layer w-tag contains multiple lex tags: {_tagStr(wTag)}'
+        morph = Morph.fromLexTag(lexes[0])
 
-            #assert len(wTag.find_all(name='edge', recursive=False)) <= 1, f'w-tag contains multiple edges: {wTag}'
-            errors = [ErrorData.fromTag(err) for err in wTag.edge.find_all(name='error')] if wTag.edge else []
+        errors = [ErrorData.fromTag(err) for edge in edges for err in edge.errors]
 
-            tokens.append(AnnotToken(
-                tid=wid,
-                baseToken=BToken(text=wTag.token.string, morph=morph),
-                layer='b',
-                sentenceId=sentId,
-                linkIdsLower=idMapBA[wid],
-                errors=errors
-            ))
+        token = AnnotToken(
+            tid=wid,
+            baseToken=BToken(text=tokenTag.text, morph=morph),
+            layer='b',
+            sentenceId=sentId,
+            linkIdsLower=idMapBA[wid],
+            errors=errors
+        )
+        tokens.append(token)
+        idToToken[wid] = token
 
-    return TokenLayer.of('b', tokens)
+    return TokenLayer('b', tokens, idToToken)
 
 
-def findTokensByIds(ids: Iterable[str], layer: TokenLayer) -> Tuple[List[AnnotToken], List[str]]:
+def findTokensByIds(ids: Sequence[str], layer: TokenLayer) -> Tuple[List[AnnotToken], List[str]]:
     """
     find tokens by IDs in the given layer, return tuple of found token list and unmatched Ids
     """
-    tokens = []
-    unmatchedIds = []
+    idToToken = layer.idToToken
+    tokens = [token for token in map(idToToken.get, ids) if token is not None]
 
-    for tokId in ids:
-        token = layer.get(tokId)
-        if not token:
-            unmatchedIds.append(tokId)
-        else:
-            tokens.append(token)
+    # unmatched IDs are rare, they are only searched for when some token is missing
+    if len(tokens) == len(ids):
+        return tokens, []
 
-    return tokens, unmatchedIds
+    return tokens, [tokId for tokId in ids if tokId not in idToToken]
 
 
 def linkLayers(wLayer: TokenLayer, aLayer: TokenLayer, bLayer: TokenLayer):
@@ -280,56 +385,74 @@ def linkLayers(wLayer: TokenLayer, aLayer: TokenLayer, bLayer: TokenLayer):
                 print(f'token "{tokId}" linked from b-layer token "{bToken.tid}" not found in a-layer')
 
 
-def createLinkedLayers(wPara: bs4.Tag, aPara: bs4.Tag, bPara: bs4.Tag) -> Tuple[TokenLayer, TokenLayer, TokenLayer]:
+def createLinkedLayers(
+        wPara: etree._Element,
+        aPara: etree._Element,
+        bPara: etree._Element
+) -> Tuple[TokenLayer, TokenLayer, TokenLayer]:
     """
     Add references to nodes in other layers.
+    Each paragraph's <w> elements are walked once, the collected WElems are reused for creating the layers.
     """
+    # both directions of the links are filled in the same pass over the edges
     idMapWA: Mapping[str, List[str]] = defaultdict(list)
+    idMapAW: Mapping[str, List[str]] = defaultdict(list)
     idMapAB: Mapping[str, List[str]] = defaultdict(list)
+    idMapBA: Mapping[str, List[str]] = defaultdict(list)
 
-    for aw in aPara.find_all(name='w'):
-        awId = aw['id']
-        for edge in aw.find_all(name='edge', recursive=False):
+    aElems: List[WElem] = []
+    for aw in aPara.iter('{*}w'):
+        awId = aw.get('id')
+        edges = [Edge.fromTag(edge) for edge in aw.iterchildren('{*}edge')]
+        for edge in edges:
             # multi-edges are broken to simple edges between all vertices which may lead to information loss
-            fromIds = [inEdge.string.split('#', maxsplit=1)[1] for inEdge in edge.find_all(name='from')]
-            toIds = [awId] + [outEdge.string for outEdge in edge.find_all(name='to')]
-            for fromId in fromIds:
+            toIds = [awId, *edge.toIds]
+            for fromId in edge.fromIds:
                 idMapWA[fromId].extend(toIds)
+                for toId in toIds:
+                    idMapAW[toId].append(fromId)
+        aElems.append(WElem(aw, awId, edges))
 
     idToDelW = findDeletions(aPara)
 
-    for bw in bPara.find_all(name='w'):
-        bwId = bw['id']
-        if bw.edge:
-            fromIds = [inEdge.string.split('#', maxsplit=1)[1] for inEdge in bw.edge.find_all(name='from')]
-            toIds = [bwId] + [outEdge.string for outEdge in bw.edge.find_all(name='to')]
-            for fromId in fromIds:
-                idMapAB[fromId].extend(toIds)
+    # b-layer tokens are the <w> elements of sentences, <w> outside of <s> are not valid in the b-layer
+    bElems: List[WElem] = []
+    for sentTag in bPara.iterchildren('{*}s'):
+        sentId = sentTag.get('id')
+        for bw in sentTag.iterchildren('{*}w'):
+            bwId = bw.get('id')
+            # only the first edge is considered in the b-layer
+            edgeTag = _firstChild(bw, '{*}edge')
+            edges = [Edge.fromTag(edgeTag)] if edgeTag is not None else []
+            for edge in edges:
+                toIds = [bwId, *edge.toIds]
+                for fromId in edge.fromIds:
+                    idMapAB[fromId].extend(toIds)
+                    for toId in toIds:
+                        idMapBA[toId].append(fromId)
+            bElems.append(WElem(bw, bwId, edges, sentId))
 
     idToDelA = findDeletions(bPara)
 
-    idMapAW = revertMapping(idMapWA)
-    idMapBA = revertMapping(idMapAB)
-
     wLayer = createWLayer(wPara=wPara, idMapWA=idMapWA, idToDelW=idToDelW)
-    aLayer = createALayer(aPara=aPara, idMapAW=idMapAW, idMapAB=idMapAB, idToDelA=idToDelA)
-    bLayer = createBLayer(bPara=bPara, idMapBA=idMapBA)
+    aLayer = createALayer(aElems=aElems, idMapAW=idMapAW, idMapAB=idMapAB, idToDelA=idToDelA)
+    bLayer = createBLayer(bElems=bElems, idMapBA=idMapBA)
 
     linkLayers(wLayer, aLayer, bLayer)
 
     return wLayer, aLayer, bLayer
 
 
-def findDeletions(paragraph: bs4.Tag) -> Dict[str, DeletionToken]:
+def findDeletions(paragraph: etree._Element) -> Dict[str, DeletionToken]:
     idToDel = {}
-    for delEdge in paragraph.find_all(name='edge', recursive=False):
-        if delEdge.to:
-            print(f'Unexpected non-deletion edge directly under <para>: {delEdge}', file=sys.stderr)
+    for delEdge in paragraph.iterchildren('{*}edge'):
+        edge = Edge.fromTag(delEdge)
+        if edge.toIds:
+            print(f'Unexpected non-deletion edge directly under <para>: {_tagStr(delEdge)}', file=sys.stderr)
             continue
-        fromIds = [inEdge.string.split('#', maxsplit=1)[1] for inEdge in delEdge.find_all(name='from')]
-        errors = [ErrorData.fromTag(err) for err in delEdge.find_all(name='error')]
+        errors = [ErrorData.fromTag(err) for err in edge.errors]
 
-        for fromId in fromIds:
+        for fromId in edge.fromIds:
             idToDel[fromId] = DeletionToken(fromId=fromId, errors=errors)
 
     return idToDel
@@ -384,20 +507,20 @@ def _noErrorsTransitive(wTok: AnnotToken) -> bool:
     """
     True is the whole annotation chain of a token from W to B layer does not contain errors
     """
-    if len(wTok.linksHigher) != 1 or isinstance(wTok.linksHigher[0], DeletionToken):
+    wLinks = wTok.linksHigher
+    if len(wLinks) != 1:
         return False
 
-    aTok = wTok.linksHigher[0]
-
-    if aTok.errors or len(aTok.linksHigher) != 1 or isinstance(aTok.linksHigher[0], DeletionToken):
+    aTok = wLinks[0]
+    if isinstance(aTok, DeletionToken) or aTok.errors:
         return False
 
-    bTok = aTok.linksHigher[0]
-
-    if bTok.errors:
+    aLinks = aTok.linksHigher
+    if len(aLinks) != 1:
         return False
 
-    return True
+    bTok = aLinks[0]
+    return not isinstance(bTok, DeletionToken) and not bTok.errors
 
 
 def getErrorTypeStr(tok: AnnotToken):
@@ -409,18 +532,30 @@ def inferErrors(tokLayer: TokenLayer):
         if not token.errors and len(token.linksLower) == 1:
             lowerTok = token.linksLower[0]
             if lowerTok.baseToken.text != token.baseToken.text:
-                token.errors = [ErrorData(tags=['unknown'], links=[])]
+                token.errors = (ErrorData(tags=('unknown',), links=()),)
 
 
-def paraToVert(bPara: bs4.Tag, aDoc: bs4.Tag, wDoc: bs4.Tag, guessErrors: bool=False) -> str:
-    bParaId = bPara['id']
-    commonId = bParaId.split('-', maxsplit=1)[1]
+def paraToVert(
+        bPara: etree._Element,
+        aParas: Mapping[str, etree._Element],
+        wParas: Mapping[str, etree._Element],
+        out: TextIO,
+        guessErrors: bool=False
+) -> None:
+    """
+    Write a B-layer paragraph to out in the vertical format, a and w paragraphs are looked up
+    in the given {paraId: para} mappings
+    """
+    bParaId = bPara.get('id')
+    _, sep, commonId = bParaId.partition('-')
+    if not sep:
+        raise ValueError(f'paragraph ID without "-": {bParaId}')
 
-    aParaId = bPara['lowerpara.rf'].split('#', maxsplit=1)[1]
-    aPara = aDoc.find(name='para', id=aParaId, recursive=False)
+    aParaId = _afterHash(bPara.get('lowerpara.rf'))
+    aPara = aParas[aParaId]
 
-    wParaId = aPara['lowerpara.rf'].split('#', maxsplit=1)[1]
-    wPara = wDoc.find(name='para', id=wParaId, recursive=False)
+    wParaId = _afterHash(aPara.get('lowerpara.rf'))
+    wPara = wParas[wParaId]
 
     wLayer, aLayer, bLayer = createLinkedLayers(wPara, aPara, bPara)
     assignSentenceIds(aLayer)
@@ -433,11 +568,14 @@ def paraToVert(bPara: bs4.Tag, aDoc: bs4.Tag, wDoc: bs4.Tag, guessErrors: bool=F
     currSentenceId = None
     vertBuffer: List[str] = []
 
-    wToks = deque(wLayer)
+    wToks = wLayer.tokens
+    wTokCnt = len(wToks)
+    i = 0
 
     vertBuffer.append(f'<p id="{commonId}">')
-    while wToks:
-        wTok = wToks.popleft()
+    while i < wTokCnt:
+        wTok = wToks[i]
+        i += 1
         if wTok.sentenceId != currSentenceId:
             if currSentenceId:
                 vertBuffer.append('</s>')
@@ -471,8 +609,9 @@ def paraToVert(bPara: bs4.Tag, aDoc: bs4.Tag, wDoc: bs4.Tag, guessErrors: bool=F
                 aTok1 = wTok.linksHigher[0]
                 if aTok1.errors:
                     errWToks = [wTok]
-                    while wToks and (aTok1 in wToks[0].linksHigher):
-                        errWToks.append(wToks.popleft())
+                    while i < wTokCnt and (aTok1 in wToks[i].linksHigher):
+                        errWToks.append(wToks[i])
+                        i += 1
 
                     errTier = '1'
                     errTypeStr = '|'.join('|'.join(e.tags) for e in aTok1.errors)
@@ -562,58 +701,148 @@ def paraToVert(bPara: bs4.Tag, aDoc: bs4.Tag, wDoc: bs4.Tag, guessErrors: bool=F
 
     vertBuffer.append('</p>')
 
-    return '\n'.join(vertBuffer)
+    # joining the paragraph lines and writing them at once is cheaper than writing line by line
+    out.write('\n'.join(vertBuffer))
+    out.write('\n')
+
+
+def indexById(elems: Iterable[etree._Element]) -> Dict[str, etree._Element]:
+    """
+    Map element IDs to elements; for duplicate IDs the first element wins
+    """
+    idToElem: Dict[str, etree._Element] = {}
+    for elem in elems:
+        idToElem.setdefault(elem.get('id'), elem)
+
+    return idToElem
+
+
+def iterDocs(xml: bytes) -> Iterator[etree._Element]:
+    """
+    Stream <doc> elements of a layer file. Each doc is freed once the consumer asks for the next one,
+    so only a single doc subtree is kept in memory.
+    """
+    for _, doc in etree.iterparse(io.BytesIO(xml), events=('end',), tag='{*}doc'):
+        yield doc
+        doc.clear()
+        while doc.getprevious() is not None:
+            del doc.getparent()[0]
 
 
-def docToVert(bDoc: bs4.Tag, wLayer: bs4.Tag, aLayer: bs4.Tag, guessErrors: bool=False) -> str:
-    bDocId = bDoc['id']
+def _getDoc(idToDoc: Mapping[str, etree._Element], docId: str, fallbackId: str) -> Optional[etree._Element]:
+    doc = idToDoc.get(docId)
+    return doc if doc is not None else idToDoc.get(fallbackId)
+
+
+def docToVert(
+        bDoc: etree._Element,
+        wDocs: Mapping[str, etree._Element],
+        aDocs: Mapping[str, etree._Element],
+        out: TextIO,
+        guessErrors: bool=False
+) -> None:
+    """
+    Write a B-layer doc to out in the vertical format, w and a docs are looked up in the given {docId: doc} mappings
+    """
+    bDocId = bDoc.get('id')
     # Use reference to lower layers to get lower layer doc IDs.
     # If the attribute 'lowerdoc.rf' is missing,
     # try two doc ID formats: 1) the same in all layers 2) prefixed by the layer name
 
-    aDocId = bDoc['lowerdoc.rf'][2:] if bDoc.has_attr('lowerdoc.rf') else 'a' + bDocId[1:]
-    aDoc = (aLayer.ldata.find(name='doc', id=aDocId, recursive=False)
-            or aLayer.ldata.find(name='doc', id=bDocId, recursive=False))
-
-    wDocId = aDoc['lowerdoc.rf'][2:] if aDoc.has_attr('lowerdoc.rf') else 'w' + bDocId[1:]
-    wDoc = (wLayer.wdata.find(name='doc', id=wDocId, recursive=False)
-            or wLayer.wdata.find(name='doc', id=bDocId, recursive=False))
+    aDocId = bDoc.get('lowerdoc.rf')[2:] if 'lowerdoc.rf' in bDoc.attrib else 'a' + bDocId[1:]
+    aDoc = _getDoc(aDocs, aDocId, bDocId)
 
-    aTokCnt = len(aDoc.find_all(name='w', recursive=True))
-    bTokCnt = len(bDoc.find_all(name='w', recursive=True))
+    wDocId = aDoc.get('lowerdoc.rf')[2:] if 'lowerdoc.rf' in aDoc.attrib else 'w' + bDocId[1:]
+    wDoc = _getDoc(wDocs, wDocId, bDocId)
 
-    if bTokCnt == 0 and aTokCnt > 0:
+    # only the presence of tokens matters, the searches stop at the first one
+    if _firstElem(bDoc, '{*}w') is None and _firstElem(aDoc, '{*}w') is not None:
         raise ValueError('B-layer annotation missing')
 
-
-    vertBuffer: List[str] = []
-
     outDocId = bDocId[2:]
-    vertBuffer.append(f'<doc id="{outDocId}">')
+    out.write(f'<doc id="{outDocId}">\n')
 
-    bParas: Iterable[bs4.Tag] = bDoc.find_all(name='para', recursive=False)
+    bParas: Iterable[etree._Element] = bDoc.iterchildren('{*}para')
+    aParas = indexById(aDoc.iterchildren('{*}para'))
+    wParas = indexById(wDoc.iterchildren('{*}para'))
 
     for bPara in bParas:
-        vertBuffer.append(paraToVert(bPara, aDoc, wDoc, guessErrors=guessErrors))
+        paraToVert(bPara, aParas, wParas, out, guessErrors=guessErrors)
+
+    out.write('</doc>\n')
 
-    vertBuffer.append('</doc>')
 
-    return '\n'.join(vertBuffer)
+def parseLowerLayers(metaXml: MetaXml) -> Tuple[Dict[str, etree._Element], Dict[str, etree._Element]]:
+    """
+    Parse the w and a layers of a document and index their docs by ID
+    """
+    # lxml releases the GIL while parsing, the w layer is parsed in a helper thread while the a layer
+    # is parsed on the calling thread. The executor is local to the call, a module-level pool
+    # would be left without threads in forked child processes.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        wLayerFuture = executor.submit(etree.fromstring, metaXml.wxml)
+        aLayer = etree.fromstring(metaXml.axml)
+        wLayer = wLayerFuture.result()
+
+    wDocs = indexById(_firstElem(wLayer, '{*}wdata').iterchildren('{*}doc'))
+    aDocs = indexById(_firstElem(aLayer, '{*}ldata').iterchildren('{*}doc'))
+
+    return wDocs, aDocs
 
 
 def xmlToVert(metaXml: MetaXml, guessErrors: bool=False) -> str:
-    wLayer = BeautifulSoup(metaXml.wxml, 'lxml-xml')
-    aLayer = BeautifulSoup(metaXml.axml, 'lxml-xml')
-    bLayer = BeautifulSoup(metaXml.bxml, 'lxml-xml')
+    """
+    Convert a document to the vertical format. The result is built in a single buffer
+    and returned as a whole, each line terminated by a newline.
+    """
+    # w and a docs are looked up by ID, so those layers are kept whole; b docs are streamed.
+    # The w and a layers are only parsed once there is a b doc to convert.
+    wDocs = aDocs = None
 
-    bDocs: Iterable[bs4.Tag] = bLayer.ldata.find_all(name='doc', recursive=False)
+    out = io.StringIO()
+
+    for bDoc in iterDocs(metaXml.bxml):
+        if wDocs is None:
+            wDocs, aDocs = parseLowerLayers(metaXml)
+        docToVert(bDoc, wDocs, aDocs, out, guessErrors=guessErrors)
+
+    return out.getvalue()
+
+
+def convertFile(metaFile: MetaFile, guessErrors: bool=False) -> Optional[str]:
+    """
+    Convert the files of a document to the vertical format. Failures are reported to stderr and None is returned.
+    """
+    print(f'processing {metaFile}', file=sys.stderr)
+    metaXml: MetaXml = iotools.readMetaFile(metaFile)
+    try:
+        return xmlToVert(metaXml, guessErrors=guessErrors)
+    except Exception:
+        print(f'Failed to process files {metaFile}', file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        return None
 
-    vertBuffer: List[str] = []
 
-    for bDoc in bDocs:
-        vertBuffer.append(docToVert(bDoc, wLayer, aLayer, guessErrors=guessErrors))
+def _convertFileCaptured(metaFile: MetaFile, guessErrors: bool) -> Tuple[Optional[str], str, str]:
+    """
+    convertFile for worker processes, returns the result along with the captured stdout and stderr
+    so that the main process can print the output of all files in order
+    """
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        vertStr = convertFile(metaFile, guessErrors=guessErrors)
+
+    return vertStr, stdout.getvalue(), stderr.getvalue()
 
-    return '\n'.join(vertBuffer)
+
+def _writeVert(vertStr: str) -> None:
+    """
+    Write the output of a document to stdout followed by an empty line. A document without any
+    b-layer docs is written as an empty line, as before the output became newline-terminated.
+    """
+    sys.stdout.write(vertStr or '\n')
+    print()
 
 
 def main():
@@ -624,23 +853,33 @@ def main():
     inputArgGrp.add_argument('-f', '--files', nargs='+', metavar='FILE', help='files to process')
     inputArgGrp.add_argument('-d', '--dir', metavar='DIR', help='directory to process')
     argparser.add_argument('-g', '--guessErrors', action='store_true', help='detect errors by comparing token texts')
+    argparser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                           help='number of documents converted in parallel, 0 for one per CPU')
 
     args = argparser.parse_args()
 
+    if args.jobs < 0:
+        argparser.error('argument -j/--jobs: must not be negative')
+
     metaFiles: Iterable[MetaFile] = iotools.getMetaFilesFromDir(args.dir) if args.dir else iotools.getMetaFiles(args.files)
 
-    for metaFile in metaFiles:
-        print(f'processing {metaFile}', file=sys.stderr)
-        metaXml: MetaXml = iotools.readMetaFile(metaFile)
-        try:
-            vertStr: str = xmlToVert(metaXml, guessErrors=args.guessErrors)
-        except Exception as e:
-            print(f'Failed to process files {metaFile}', file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
-            continue
+    jobs: int = args.jobs or os.cpu_count() or 1
+
+    if jobs > 1:
+        # documents are independent, each worker reads and converts whole documents
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(_convertFileCaptured, metaFiles, itertools.repeat(args.guessErrors))
+            for vertStr, outStr, errStr in results:
+                sys.stderr.write(errStr)
+                sys.stdout.write(outStr)
+                if vertStr is not None:
+                    _writeVert(vertStr)
+        return
 
-        print(vertStr)
-        print()
+    for metaFile in metaFiles:
+        vertStr = convertFile(metaFile, guessErrors=args.guessErrors)
+        if vertStr is not None:
+            _writeVert(vertStr)
 
 
 if __name__ == '__main__':
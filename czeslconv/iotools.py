@@ -9,7 +9,7 @@ import os.path
 
 from collections import defaultdict
 from os import DirEntry
-from typing import Dict, Iterable, Mapping, NamedTuple
+from typing import BinaryIO, Dict, Iterable, Mapping, NamedTuple
 
 
 class MetaFile(NamedTuple):
@@ -24,26 +24,47 @@ class MetaFile(NamedTuple):
 
 class MetaXml(NamedTuple):
     """
-    Tuple of XML strings belonging to the same annotated document
+    Tuple of XML documents belonging to the same annotated document, as read from the files.
+    The content is not decoded, the parser takes the encoding from the XML declaration.
     """
     name: str
-    wxml: str
-    axml: str
-    bxml: str
+    wxml: bytes
+    axml: bytes
+    bxml: bytes
 
 
-def readFile(fileName: str) -> str:
-    with open(fileName, 'r', encoding='utf-8') as f:
+def readFile(fileName: str) -> bytes:
+    with open(fileName, 'rb') as f:
         return f.read()
 
 
+def _adviseWillNeed(f: BinaryIO) -> None:
+    """
+    Hint the OS to start reading the whole file in the background (no-op where posix_fadvise is unavailable
+    or the file does not support it, e.g. a pipe)
+    """
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+
+
 def readMetaFile(metaFile: MetaFile) -> MetaXml:
-    return MetaXml(
-        name=metaFile.name,
-        wxml=readFile(metaFile.wfile),
-        axml=readFile(metaFile.afile),
-        bxml=readFile(metaFile.bfile)
-    )
+    """
+    Read all files of a document. The files are opened and announced to the OS first,
+    so that the a and b files are being prefetched while the w file is read.
+    """
+    with open(metaFile.wfile, 'rb') as wf, open(metaFile.afile, 'rb') as af, open(metaFile.bfile, 'rb') as bf:
+        for f in (wf, af, bf):
+            _adviseWillNeed(f)
+
+        return MetaXml(
+            name=metaFile.name,
+            wxml=wf.read(),
+            axml=af.read(),
+            bxml=bf.read()
+        )
 
 
 def _processFileGroups(baseNameToPaths: Mapping[str, Dict[str, str]]) -> Iterable[MetaFile]:
@@ -75,12 +96,14 @@ def getMetaFiles(filenames: Iterable[str]) -> Iterable[MetaFile]:
     @param filenames: iterable of file names
     @return: generator of MetaFiles, which group together triples mentioned above
     """
-    fullPaths = frozenset(os.path.abspath(fn) for fn in filenames if fn.endswith('.xml'))
+    # same as os.path.abspath, but the working directory is looked up only once
+    cwd = os.getcwd()
+    fullPaths = frozenset(os.path.normpath(os.path.join(cwd, fn)) for fn in filenames if fn.endswith('.xml'))
 
     baseNameToPaths: Mapping[str, Dict[str, str]] = defaultdict(dict)
     for path in fullPaths:
-        fileName = os.path.basename(path)
-        baseName = fileName[:fileName.find('.')]
+        fileName = path.rpartition(os.sep)[2]
+        baseName = fileName.partition('.')[0]
         baseNameToPaths[baseName][fileName] = path
 
     yield from _processFileGroups(baseNameToPaths)
@@ -93,11 +116,11 @@ def getMetaFilesFromDir(dirName: str) -> Iterable[MetaFile]:
     @return: generator of MetaFiles, which group together triples mentioned above
     """
     dirEntries: Iterable[DirEntry] = os.scandir(dirName)
-    xmlEntries: Iterable[DirEntry] = (e for e in dirEntries if e.is_file() and e.name.endswith('.xml'))
+    xmlEntries: Iterable[DirEntry] = (e for e in dirEntries if e.name.endswith('.xml') and e.is_file())
 
     baseNameToPaths: Mapping[str, Dict[str, str]] = defaultdict(dict)
     for entry in xmlEntries:
-        baseName = entry.name[:entry.name.find('.')]
+        baseName = entry.name.partition('.')[0]
         baseNameToPaths[baseName][entry.name] = entry.path
 
     yield from _processFileGroups(baseNameToPaths)
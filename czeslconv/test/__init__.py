@@ -0,0 +1,14 @@
+# coding=utf-8
+
+import os
+
+
+def load_tests(loader, standardTests, pattern):
+    """
+    Collect the test modules of the package, so that the tests run with `python -m unittest czeslconv.test`
+    """
+    thisDir = os.path.dirname(__file__)
+    topLevelDir = os.path.dirname(os.path.dirname(thisDir))
+    packageTests = loader.discover(start_dir=thisDir, pattern=pattern or 'test*.py', top_level_dir=topLevelDir)
+    standardTests.addTests(packageTests)
+    return standardTests
@@ -0,0 +1,99 @@
+token "a-d1p1w11" linked from w-layer token "w-d1p1w11" not found in a-layer
+<doc id="d1">
+<p id="d1p1">
+<s id="b-d1p1s1">
+Já	w-d1p1w1	a-d1p1w1	b-d1p1w1	já	PP1
+<err level="1" type="incorInfl|other">
+mam	w-d1p1w2				
+</err>
+<corr level="1" type="incorInfl|other">
+mám		a-d1p1w2	b-d1p1w2	mít	VB1
+</corr>
+<err level="2" type="incorBase">
+rad	w-d1p1w3	a-d1p1w3		rad|rád	A1|+|A2|A3
+</err>
+<corr level="2" type="incorBase">
+rád			b-d1p1w3	rád	A2
+</corr>
+<err level="1" type="wbdOther">
+pra	w-d1p1w4				
+hu	w-d1p1w5				
+</err>
+<corr level="1" type="wbdOther">
+<err level="2" type="cap">
+prahu		a-d1p1w4		praha	NN
+</err>
+<corr level="2" type="cap">
+Prahu			b-d1p1w4	Praha	NN
+</corr>
+</corr>
+<err level="1" type="redund">
+a	w-d1p1w6				
+</err>
+<corr level="1" type="redund">
+===NONE===		NA	NA		
+</corr>
+<err level="2" type="redund">
+take	w-d1p1w7	a-d1p1w7		také	DB
+</err>
+<corr level="2" type="redund">
+===NONE===			NA		
+</corr>
+<err level="2" type="wbd">
+Brno	w-d1p1w8	a-d1p1w8		Brno	NNN
+</err>
+<corr level="2" type="wbd">
+Br			b-d1p1w8	Br	X
+no			b-d1p1w80	no	X
+</corr>
+</s>
+<s id="b-d1p1s2">
+.	w-d1p1w9	a-d1p1w9	b-d1p1w9	.	Z
+<err level="1" type="del">
+orphan	w-d1p1w10				
+</err>
+<corr level="1" type="del">
+===NONE===		NA	NA		
+</corr>
+<err level="1" type="del">
+x	w-d1p1w11				
+</err>
+<corr level="1" type="del">
+===NONE===		NA	NA		
+</corr>
+<err level="1" type="wbdComp">
+nejde	w-d1p1w12				
+</err>
+<corr level="1" type="wbdComp">
+ne		a-d1p1w12	b-d1p1w12	ne	TT
+jde		a-d1p1w13	b-d1p1w13	jít	VB
+</corr>
+<err level="1" type="x">
+konec	w-d1p1w13				
+</err>
+<corr level="1" type="x">
+konec		a-d1p1w14	b-d1p1w14	konec	NN
+konec		a-d1p1w14	b-d1p1w14	konec	NN
+</corr>
+</s>
+</p>
+</doc>
+<doc id="d2">
+<p id="d2p1">
+<s id="b-d2p1s1">
+<err level="1" type="unknown">
+Ahooj	w-d2p1w1				
+</err>
+<corr level="1" type="unknown">
+Ahoj		a-d2p1w1	b-d2p1w1	ahoj	II
+</corr>
+<err level="1" type="diacr">
+svete	w-d2p1w2				
+</err>
+<corr level="1" type="diacr">
+světe		a-d2p1w2	b-d2p1w2	svět	NN
+</corr>
+</s>
+</p>
+</doc>
+
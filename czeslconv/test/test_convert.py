@@ -0,0 +1,60 @@
+# coding=utf-8
+
+"""
+Regression tests of the command line conversion against expected vertical output.
+
+The fixture AA_NS_001 is a namespaced w/a/b triple covering error groups on both levels,
+deletions of w and a tokens, merged and split tokens and tokens with differing texts
+but no error annotation (reported only with --guessErrors).
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+from typing import List
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+PACKAGE_PARENT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _dataPath(fileName: str) -> str:
+    return os.path.join(DATA_DIR, fileName)
+
+
+def _readExpected(fileName: str) -> bytes:
+    with open(_dataPath(fileName), 'rb') as f:
+        return f.read()
+
+
+def _runConvert(args: List[str]) -> bytes:
+    """
+    Run the converter as a script and return its standard output
+    """
+    result = subprocess.run(
+        [sys.executable, '-m', 'czeslconv.convert', *args],
+        cwd=PACKAGE_PARENT_DIR,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True
+    )
+    return result.stdout
+
+
+class ConvertTest(unittest.TestCase):
+
+    files = [_dataPath(f'AA_NS_001.{layer}.xml') for layer in ('w', 'a', 'b')]
+
+    def testConvert(self):
+        self.assertEqual(_readExpected('AA_NS_001.vert'), _runConvert(['-f', *self.files]))
+
+    def testConvertGuessErrors(self):
+        self.assertEqual(_readExpected('AA_NS_001.g.vert'), _runConvert(['-g', '-f', *self.files]))
+
+    def testConvertParallel(self):
+        self.assertEqual(_readExpected('AA_NS_001.vert'), _runConvert(['-j', '2', '-f', *self.files]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,7 +23,7 @@ setup(
 
     # Dependencies
     # lxml requries C libraries libxml2 and libxslt installed on your system
-    install_requires=['beautifulsoup4>=4.6', 'lxml>=4.0'],
+    install_requires=['lxml>=4.0'],
 
     packages=['czeslconv'],
 